@@ -7,21 +7,33 @@ Author: John Rish Ladica
 Affiliation: Student Leader, SLSU-HC – Society of Information Technology Students (SITS)
 """
 
-import io
-import json
+import functools
+import gzip
+import hashlib
 import logging
 import os
 import re
 import secrets
 import sqlite3
 import threading
+import unicodedata
 import zipfile
 from datetime import datetime, timezone
+from urllib.parse import quote
 
-from flask import Flask, jsonify, request, send_file, send_from_directory
+import orjson
+
+try:
+    import brotlicffi as brotli
+except ImportError:  # Flask-Compress installs one of the two Brotli bindings
+    import brotli
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import JSONProvider
+from flask_compress import Compress
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from werkzeug.http import dump_options_header
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from lib.auth import (
@@ -31,14 +43,18 @@ from lib.auth import (
     verify_password_reset_token,
     require_auth,
 )
-from lib.database import get_sqlite_connection, SUPABASE_URL, SUPABASE_KEY, GEMINI_KEY
+from lib.config import ALLOWED_ORIGINS, GEMINI_KEY, RATELIMIT_STORAGE_URI, SECRET_KEY, SUPABASE_KEY, SUPABASE_URL
+from lib.database import borrow_connection, get_sqlite_connection, insert_collaborators, insert_generated_files, rows_to_dicts
 from lib.agents import (
     refine_user_prompt,
     create_system_plan,
     generate_project_files,
+    PLAN_CACHE_VERSION,
+    REFINE_CACHE_VERSION,
     review_generated_code,
     refactor_code,
 )
+from lib.llm import agent_cache_stats, cached_agent_call
 
 # ---------------------------------------------------------------------------
 # Environment validation
@@ -58,7 +74,6 @@ def _validate_environment():
         raise RuntimeError("JWT_SECRET environment variable must be at least 32 characters")
 
 # Get or generate SECRET_KEY
-SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY or len(SECRET_KEY) < 32:
     SECRET_KEY = secrets.token_hex(32)
     logging.warning("WARNING: SECRET_KEY not set or too short – using auto-generated value. Set SECRET_KEY (min 32 chars) for stable sessions.")
@@ -69,20 +84,55 @@ if not SECRET_KEY or len(SECRET_KEY) < 32:
 
 API_VERSION = "3.1.1"
 
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson for ``jsonify`` and ``request.get_json``."""
+
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=self.option), mimetype="application/json"
+        )
+
+
 app = Flask(__name__, static_folder="static")
+app.json = OrjsonProvider(app)
 app.config.update(
     JSON_SORT_KEYS=False,
     JSONIFY_PRETTYPRINT_REGULAR=False,
     SECRET_KEY=SECRET_KEY,
+    MAX_CONTENT_LENGTH=1_048_576,  # reject oversized bodies before JSON parsing
+    # Compress JSON/HTML/CSS/JS responses; ZIP exports are not in the mimetype
+    # list and stream through untouched.
+    COMPRESS_ALGORITHM=["br", "gzip"],
+    COMPRESS_MIN_SIZE=500,
+    COMPRESS_LEVEL=4,
+    COMPRESS_BR_LEVEL=4,
 )
+Compress(app)
 
 # Configure CORS with restricted origins (production should use specific domains)
-ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 if "*" in ALLOWED_ORIGINS:
     logging.warning("WARNING: CORS is configured to allow all origins. Set ALLOWED_ORIGINS in production.")
 CORS(app, resources={r"/*": {"origins": ALLOWED_ORIGINS}})
 
-limiter = Limiter(app=app, key_func=get_remote_address, default_limits=["200 per hour"])
+# In-memory limits are per worker process; set REDIS_URL to share counters
+# across Gunicorn workers and replicas (requires the ``redis`` package).
+limiter = Limiter(
+    app=app,
+    key_func=get_remote_address,
+    default_limits=["200 per hour"],
+    storage_uri=RATELIMIT_STORAGE_URI,
+    strategy="moving-window",
+)
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -150,27 +200,108 @@ def sanitize_text_input(text, max_length=10000):
         raise ApiError(f"Input exceeds maximum length of {max_length} characters", 400)
     return text
 
+MAX_SPEC_BYTES = 200_000
+
+
+def ensure_payload_size(value, label, max_bytes=MAX_SPEC_BYTES):
+    """Reject structured payloads whose JSON encoding exceeds *max_bytes*."""
+    try:
+        size = len(orjson.dumps(value))
+    except orjson.JSONEncodeError:
+        raise ApiError(f"Invalid {label}", 400)
+    if size > max_bytes:
+        raise ApiError(f"{label.capitalize()} exceeds maximum size of {max_bytes} bytes", 413)
+
+
+# ---------------------------------------------------------------------------
+# Response helpers
+# ---------------------------------------------------------------------------
+
+def json_envelope(**fields):
+    """Build a JSON object response from already-serialized *fields*.
+
+    Each value must be JSON-encoded ``bytes``; this lets a payload that is
+    also persisted to the database be serialized only once.
+    """
+    body = b"{" + b",".join(orjson.dumps(k) + b":" + v for k, v in fields.items()) + b"}"
+    return Response(body, mimetype="application/json")
+
+
+def attachment_disposition(filename):
+    """Return a ``Content-Disposition`` value that downloads as *filename*.
+
+    Matches ``send_file``: non-ASCII names get an NFKD-transliterated
+    ``filename`` fallback plus an RFC 5987 ``filename*`` parameter.
+    """
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii")
+        # safe = RFC 5987 attr-char
+        quoted = quote(filename, safe="!#$&+-.^_`|~")
+        return dump_options_header("attachment", {"filename": simple, "filename*": f"UTF-8''{quoted}"})
+    return dump_options_header("attachment", {"filename": filename})
+
+
+class _ZipChunkSink:
+    """Write-only file object that buffers ZIP output between drains."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return b"".join(chunks)
+
+
+def stream_zip(entries, compresslevel=None):
+    """Yield a ZIP archive of ``(name, content)`` *entries* chunk by chunk.
+
+    The sink is not seekable, so zipfile writes data descriptors and each
+    member can be sent as soon as it is compressed.
+    """
+    sink = _ZipChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+        for name, content in entries:
+            zf.writestr(name, content)
+            yield sink.drain()
+    yield sink.drain()
+
 
 # ---------------------------------------------------------------------------
 # Error handlers
 # ---------------------------------------------------------------------------
 
-@app.errorhandler(ApiError)
-def handle_api_error(error):
+def error_response(message, status_code):
+    """Build the JSON error body shared by all error handlers."""
     return jsonify({
-        "error": error.message,
+        "error": message,
         "timestamp": datetime.now(timezone.utc).isoformat(),
-    }), error.status_code
+    }), status_code
+
+
+@app.errorhandler(ApiError)
+def handle_api_error(error):
+    return error_response(error.message, error.status_code)
+
+
+@app.errorhandler(413)
+def handle_payload_too_large(error):
+    return error_response("Request body too large", 413)
 
 
 @app.errorhandler(Exception)
 def handle_unexpected_error(error):
     logger.exception("Unexpected error")
     # Don't leak internal error details to clients
-    return jsonify({
-        "error": "Internal server error",
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-    }), 500
+    return error_response("Internal server error", 500)
 
 
 # ---------------------------------------------------------------------------
@@ -194,8 +325,7 @@ def register():
     if len(password) > 128:
         raise ApiError("Password is too long (max 128 characters)")
 
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection() as conn:
         if conn.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone():
             raise ApiError("User already exists", 409)
 
@@ -208,8 +338,6 @@ def register():
         user_id = cursor.lastrowid
         logger.info(f"New user registered: {email}")
         return jsonify({"token": generate_token(user_id, email), "user": {"id": user_id, "email": email, "full_name": full_name}})
-    finally:
-        conn.close()
 
 
 @app.route("/api/auth/login", methods=["POST"])
@@ -224,8 +352,7 @@ def login():
     if not validate_email(email):
         raise ApiError("Invalid email format")
 
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection() as conn:
         user = conn.execute(
             "SELECT id, email, password_hash, full_name FROM users WHERE email = ?",
             (email,),
@@ -238,15 +365,13 @@ def login():
         conn.commit()
         logger.info(f"User logged in: {email}")
         return jsonify({"token": generate_token(user["id"], user["email"]), "user": {"id": user["id"], "email": user["email"], "full_name": user["full_name"]}})
-    finally:
-        conn.close()
 
 
 @app.route("/api/auth/me", methods=["GET"])
 @require_auth
 def get_current_user():
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection(read_only=True) as conn:
+        conn.execute("BEGIN DEFERRED")
         user = conn.execute(
             "SELECT id, email, full_name, created_at FROM users WHERE id = ?",
             (request.user_id,),
@@ -254,8 +379,6 @@ def get_current_user():
         if not user:
             raise ApiError("User not found", 404)
         return jsonify(dict(user))
-    finally:
-        conn.close()
 
 
 @app.route("/api/auth/update-profile", methods=["PUT"])
@@ -268,8 +391,7 @@ def update_profile():
     if not full_name:
         raise ApiError("Full name is required")
     
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection() as conn:
         conn.execute(
             "UPDATE users SET full_name = ? WHERE id = ?",
             (full_name, request.user_id),
@@ -277,8 +399,6 @@ def update_profile():
         conn.commit()
         logger.info(f"User {request.user_id} updated profile")
         return jsonify({"message": "Profile updated successfully", "full_name": full_name})
-    finally:
-        conn.close()
 
 
 @app.route("/api/auth/change-password", methods=["PUT"])
@@ -294,8 +414,7 @@ def change_password():
     if len(new_password) < 8:
         raise ApiError("New password must be at least 8 characters")
     
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection() as conn:
         user = conn.execute(
             "SELECT password_hash FROM users WHERE id = ?",
             (request.user_id,),
@@ -311,8 +430,6 @@ def change_password():
         )
         conn.commit()
         return jsonify({"message": "Password changed successfully"})
-    finally:
-        conn.close()
 
 
 @app.route("/api/auth/forgot-password", methods=["POST"])
@@ -325,8 +442,7 @@ def forgot_password():
     if not email:
         raise ApiError("Email is required")
     
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection() as conn:
         user = conn.execute(
             "SELECT id FROM users WHERE email = ?",
             (email,),
@@ -342,8 +458,6 @@ def forgot_password():
         return jsonify({
             "message": "If an account exists with this email, a reset link has been sent"
         })
-    finally:
-        conn.close()
 
 
 @app.route("/api/auth/reset-password", methods=["POST"])
@@ -362,8 +476,7 @@ def reset_password():
     payload = verify_password_reset_token(token)
     email = payload.get("email")
     
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection() as conn:
         user = conn.execute(
             "SELECT id FROM users WHERE email = ?",
             (email,),
@@ -379,8 +492,6 @@ def reset_password():
         )
         conn.commit()
         return jsonify({"message": "Password reset successfully"})
-    finally:
-        conn.close()
 
 
 # ---------------------------------------------------------------------------
@@ -436,8 +547,8 @@ def list_projects():
     per_page = min(100, max(1, int(request.args.get("per_page", 50))))
     offset = (page - 1) * per_page
     
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection(read_only=True) as conn:
+        conn.execute("BEGIN DEFERRED")
         # Build WHERE clause
         where_clauses = ["user_id = ?"]
         params = [request.user_id]
@@ -460,10 +571,10 @@ def list_projects():
         # Get paginated results
         query = f"SELECT * FROM projects{where_clause} ORDER BY updated_at DESC LIMIT ? OFFSET ?"
         params_with_pagination = params + [per_page, offset]
-        rows = conn.execute(query, params_with_pagination).fetchall()
+        projects = rows_to_dicts(conn.execute(query, params_with_pagination))
         
         return jsonify({
-            "projects": [dict(r) for r in rows],
+            "projects": projects,
             "pagination": {
                 "page": page,
                 "per_page": per_page,
@@ -471,8 +582,6 @@ def list_projects():
                 "pages": (total + per_page - 1) // per_page
             }
         })
-    finally:
-        conn.close()
 
 
 @app.route("/api/projects", methods=["POST"])
@@ -490,8 +599,7 @@ def create_project():
     if not name or not goal:
         raise ApiError("Project name and goal are required")
 
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection() as conn:
         cursor = conn.execute(
             "INSERT INTO projects (user_id, name, description, goal, audience, ui_style, constraints, status) VALUES (?, ?, ?, ?, ?, ?, ?, 'draft')",
             (request.user_id, name, description, goal, audience, ui_style, constraints),
@@ -499,15 +607,13 @@ def create_project():
         conn.commit()
         logger.info(f"User {request.user_id} created project: {name}")
         return jsonify({"id": cursor.lastrowid, "name": name, "status": "draft"})
-    finally:
-        conn.close()
 
 
 @app.route("/api/projects/<int:project_id>", methods=["GET"])
 @require_auth
 def get_project(project_id):
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection(read_only=True) as conn:
+        conn.execute("BEGIN DEFERRED")
         # Check access (owner or collaborator)
         has_access, is_owner, role = check_project_access(conn, project_id, request.user_id)
         if not has_access:
@@ -518,17 +624,15 @@ def get_project(project_id):
         if not project:
             raise ApiError("Project not found", 404)
 
-        iterations = conn.execute("SELECT * FROM project_iterations WHERE project_id = ? ORDER BY iteration_number DESC", (project_id,)).fetchall()
-        files = conn.execute("SELECT * FROM generated_files WHERE project_id = ?", (project_id,)).fetchall()
+        iterations = rows_to_dicts(conn.execute("SELECT * FROM project_iterations WHERE project_id = ? ORDER BY iteration_number DESC", (project_id,)))
+        files = rows_to_dicts(conn.execute("SELECT * FROM generated_files WHERE project_id = ?", (project_id,)))
         
         return jsonify({
             "project": dict(project),
-            "iterations": [dict(i) for i in iterations],
-            "files": [dict(f) for f in files],
+            "iterations": iterations,
+            "files": files,
             "access": {"role": role, "is_owner": is_owner}
         })
-    finally:
-        conn.close()
 
 
 @app.route("/api/projects/<int:project_id>", methods=["PUT"])
@@ -542,8 +646,7 @@ def update_project(project_id):
     if not name:
         raise ApiError("Project name is required")
     
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection() as conn:
         # Check access with editor permission required
         has_access, is_owner, role = check_project_access(conn, project_id, request.user_id, required_role="editor")
         if not has_access:
@@ -558,16 +661,13 @@ def update_project(project_id):
         conn.commit()
         logger.info(f"User {request.user_id} updated project {project_id}")
         return jsonify({"message": "Project updated successfully", "id": project_id})
-    finally:
-        conn.close()
 
 
 @app.route("/api/projects/<int:project_id>", methods=["DELETE"])
 @require_auth
 def delete_project(project_id):
     """Delete a project and all associated data (owner only)."""
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection() as conn:
         # Only owner can delete
         project = conn.execute(
             "SELECT id FROM projects WHERE id = ? AND user_id = ?",
@@ -586,16 +686,14 @@ def delete_project(project_id):
         
         logger.info(f"User {request.user_id} deleted project {project_id}")
         return jsonify({"message": "Project deleted successfully"})
-    finally:
-        conn.close()
 
 
 @app.route("/api/projects/<int:project_id>/collaborators", methods=["GET"])
 @require_auth
 def list_collaborators(project_id):
     """List project collaborators."""
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection(read_only=True) as conn:
+        conn.execute("BEGIN DEFERRED")
         # Verify user has access to project
         project = conn.execute(
             "SELECT id FROM projects WHERE id = ? AND user_id = ?",
@@ -605,18 +703,16 @@ def list_collaborators(project_id):
         if not project:
             raise ApiError("Project not found", 404)
         
-        collaborators = conn.execute(
+        collaborators = rows_to_dicts(conn.execute(
             """SELECT c.id, c.user_id, c.role, c.added_at, u.email, u.full_name
                FROM project_collaborators c
                JOIN users u ON c.user_id = u.id
                WHERE c.project_id = ?
                ORDER BY c.added_at DESC""",
             (project_id,)
-        ).fetchall()
+        ))
         
-        return jsonify({"collaborators": [dict(c) for c in collaborators]})
-    finally:
-        conn.close()
+        return jsonify({"collaborators": collaborators})
 
 
 @app.route("/api/projects/<int:project_id>/collaborators", methods=["POST"])
@@ -634,8 +730,7 @@ def add_collaborator(project_id):
     if role not in ["viewer", "editor"]:
         raise ApiError("Role must be 'viewer' or 'editor'")
     
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection() as conn:
         # Verify user owns the project
         project = conn.execute(
             "SELECT id FROM projects WHERE id = ? AND user_id = ?",
@@ -660,10 +755,7 @@ def add_collaborator(project_id):
         
         # Add collaborator
         try:
-            conn.execute(
-                "INSERT INTO project_collaborators (project_id, user_id, role) VALUES (?, ?, ?)",
-                (project_id, user["id"], role)
-            )
+            insert_collaborators(conn, project_id, [(user["id"], role)])
             conn.commit()
             logger.info(f"User {request.user_id} added collaborator {user['id']} to project {project_id}")
             return jsonify({
@@ -674,16 +766,13 @@ def add_collaborator(project_id):
             })
         except sqlite3.IntegrityError:
             raise ApiError("User is already a collaborator", 409)
-    finally:
-        conn.close()
 
 
 @app.route("/api/projects/<int:project_id>/collaborators/<int:user_id>", methods=["DELETE"])
 @require_auth
 def remove_collaborator(project_id, user_id):
     """Remove a collaborator from a project."""
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection() as conn:
         # Verify user owns the project
         project = conn.execute(
             "SELECT id FROM projects WHERE id = ? AND user_id = ?",
@@ -703,8 +792,6 @@ def remove_collaborator(project_id, user_id):
             raise ApiError("Collaborator not found", 404)
         
         return jsonify({"message": "Collaborator removed successfully"})
-    finally:
-        conn.close()
 
 
 # ---------------------------------------------------------------------------
@@ -725,25 +812,27 @@ def refine_prompt_endpoint():
         raise ApiError("Prompt is required")
 
     try:
-        refined = refine_user_prompt(user_input, context)
+        refined = cached_agent_call(
+            "refine", refine_user_prompt, user_input, context,
+            version=REFINE_CACHE_VERSION, no_cache=bool(data.get("regenerate")),
+        )
     except Exception as e:
         logger.error(f"Failed to refine prompt: {e}")
         raise ApiError("Failed to refine prompt. Please try again or simplify your request.", 500)
 
+    refined_json = orjson.dumps(refined)
+
     if project_id:
-        conn = get_sqlite_connection()
-        try:
+        with borrow_connection() as conn:
             project = conn.execute("SELECT id FROM projects WHERE id = ? AND user_id = ?", (project_id, request.user_id)).fetchone()
             if project:
                 row = conn.execute("SELECT MAX(iteration_number) as max_iter FROM project_iterations WHERE project_id = ?", (project_id,)).fetchone()
                 next_iter = (row["max_iter"] or 0) + 1
-                conn.execute("INSERT INTO project_iterations (project_id, iteration_number, refined_prompt) VALUES (?, ?, ?)", (project_id, next_iter, json.dumps(refined)))
+                conn.execute("INSERT INTO project_iterations (project_id, iteration_number, refined_prompt) VALUES (?, ?, ?)", (project_id, next_iter, refined_json.decode()))
                 conn.commit()
-        finally:
-            conn.close()
 
     logger.info(f"User {request.user_id} refined prompt for project {project_id}")
-    return jsonify({"refined": refined, "original": user_input})
+    return json_envelope(refined=refined_json, original=orjson.dumps(user_input))
 
 
 @app.route("/api/generate-plan", methods=["POST"])
@@ -757,26 +846,29 @@ def generate_plan_endpoint():
 
     if not refined_spec:
         raise ApiError("Refined specification is required")
+    ensure_payload_size(refined_spec, "refined specification")
 
     try:
-        plan = create_system_plan(refined_spec)
+        plan = cached_agent_call(
+            "plan", create_system_plan, refined_spec,
+            version=PLAN_CACHE_VERSION, no_cache=bool(data.get("regenerate")),
+        )
     except Exception as e:
         logger.error(f"Failed to generate plan: {e}")
         raise ApiError("Failed to generate plan. Please try again.", 500)
 
+    plan_json = orjson.dumps(plan)
+
     if project_id:
-        conn = get_sqlite_connection()
-        try:
+        with borrow_connection() as conn:
             conn.execute(
                 "UPDATE project_iterations SET plan = ? WHERE project_id = ? AND iteration_number = (SELECT MAX(iteration_number) FROM project_iterations WHERE project_id = ?)",
-                (json.dumps(plan), project_id, project_id),
+                (plan_json.decode(), project_id, project_id),
             )
             conn.commit()
-        finally:
-            conn.close()
 
     logger.info(f"User {request.user_id} generated plan for project {project_id}")
-    return jsonify({"plan": plan})
+    return json_envelope(plan=plan_json)
 
 
 @app.route("/api/generate-system", methods=["POST"])
@@ -791,46 +883,55 @@ def generate_system_endpoint():
 
     if not plan or not refined_spec:
         raise ApiError("Plan and refined specification are required")
+    ensure_payload_size(plan, "plan")
+    ensure_payload_size(refined_spec, "refined specification")
 
     try:
-        logger.info("Generating project files …")
         files = generate_project_files(plan, refined_spec)
-
-        logger.info("Reviewing generated code …")
         review = review_generated_code(files, plan, refined_spec)
-
-        logger.info("Applying refactoring …")
         final_files, refactor_msg = refactor_code(files, review)
     except Exception as e:
         logger.error(f"Failed to generate system: {e}")
         raise ApiError("Failed to generate system. The AI service may be overloaded. Please try again.", 500)
 
+    review_json = orjson.dumps(review)
+
     if project_id:
-        conn = get_sqlite_connection()
-        try:
+        for filename, content in final_files.items():
+            # Validate file size - reject if too large
+            if len(content) > 1_000_000:  # 1MB limit per file
+                logger.error(f"File {filename} exceeds 1MB limit ({len(content)} bytes)")
+                raise ApiError(
+                    f"Generated file '{filename}' exceeds 1MB limit. "
+                    "Try simplifying your project or breaking it into smaller components.",
+                    400
+                )
+        with borrow_connection() as conn:
             conn.execute("DELETE FROM generated_files WHERE project_id = ?", (project_id,))
-            for filename, content in final_files.items():
-                # Validate file size - reject if too large
-                if len(content) > 1_000_000:  # 1MB limit per file
-                    logger.error(f"File {filename} exceeds 1MB limit ({len(content)} bytes)")
-                    raise ApiError(
-                        f"Generated file '{filename}' exceeds 1MB limit. "
-                        "Try simplifying your project or breaking it into smaller components.",
-                        400
-                    )
-                file_type = filename.rsplit(".", 1)[-1] if "." in filename else "txt"
-                conn.execute("INSERT INTO generated_files (project_id, filename, content, file_type) VALUES (?, ?, ?, ?)", (project_id, filename, content, file_type))
+            insert_generated_files(conn, project_id, final_files)
             conn.execute(
                 "UPDATE project_iterations SET review_notes = ? WHERE project_id = ? AND iteration_number = (SELECT MAX(iteration_number) FROM project_iterations WHERE project_id = ?)",
-                (json.dumps(review), project_id, project_id),
+                (review_json.decode(), project_id, project_id),
             )
             conn.execute("UPDATE projects SET status = 'generated', updated_at = CURRENT_TIMESTAMP WHERE id = ?", (project_id,))
             conn.commit()
-            logger.info(f"User {request.user_id} generated system for project {project_id}")
-        finally:
-            conn.close()
 
-    return jsonify({"files": {n: len(c) for n, c in final_files.items()}, "review": review, "refactor_message": refactor_msg, "total_files": len(final_files)})
+    logger.info(
+        "User %s generated system for project %s (%d files)",
+        request.user_id, project_id, len(final_files),
+        extra={"project_id": project_id, "n_files": len(final_files)},
+    )
+
+    return json_envelope(
+        files=orjson.dumps({n: len(c) for n, c in final_files.items()}),
+        review=review_json,
+        refactor_message=orjson.dumps(refactor_msg),
+        total_files=orjson.dumps(len(final_files)),
+    )
+
+
+# Generated exports are downloaded once; fast deflate beats a smaller archive.
+EXPORT_COMPRESSLEVEL = 1
 
 
 @app.route("/api/projects/<int:project_id>/export", methods=["GET"])
@@ -838,8 +939,8 @@ def generate_system_endpoint():
 @require_auth
 def export_project(project_id):
     """Export project as a downloadable ZIP archive."""
-    conn = get_sqlite_connection()
-    try:
+    with borrow_connection(read_only=True) as conn:
+        conn.execute("BEGIN DEFERRED")
         # Check access (owner or collaborator)
         has_access, is_owner, role = check_project_access(conn, project_id, request.user_id)
         if not has_access:
@@ -853,17 +954,15 @@ def export_project(project_id):
         if not files:
             raise ApiError("No files to export", 404)
 
-        buf = io.BytesIO()
         project_name = project["name"].replace(" ", "_")
-        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-            for f in files:
-                zf.writestr(f"{project_name}/{f['filename']}", f["content"])
-        buf.seek(0)
+        entries = [(f"{project_name}/{f['filename']}", f["content"]) for f in files]
         
         logger.info(f"User {request.user_id} exported project {project_id}")
-        return send_file(buf, mimetype="application/zip", as_attachment=True, download_name=f"{project_name}.zip")
-    finally:
-        conn.close()
+        return Response(
+            stream_zip(entries, compresslevel=EXPORT_COMPRESSLEVEL),
+            mimetype="application/zip",
+            headers={"Content-Disposition": attachment_disposition(f"{project_name}.zip")},
+        )
 
 
 # ---------------------------------------------------------------------------
@@ -883,9 +982,8 @@ def health():
     
     # Check database connectivity
     try:
-        conn = get_sqlite_connection()
-        conn.execute("SELECT 1").fetchone()
-        conn.close()
+        with borrow_connection(read_only=True) as conn:
+            conn.execute("SELECT 1").fetchone()
         health_status["database"] = "connected"
     except Exception as e:
         health_status["database"] = "error"
@@ -896,9 +994,52 @@ def health():
     return jsonify(health_status), status_code
 
 
+@app.route("/api/cache/stats")
+@require_auth
+def cache_stats():
+    """Agent result cache counters for this worker plus the shared row count."""
+    return jsonify(agent_cache_stats())
+
+
+# index.html is compressed here, once per encoding, instead of by
+# Flask-Compress: it rewrites the ETag to "<hash>:br" after the view runs, so
+# the view's own conditional check would never match and every revalidation
+# would re-render and re-compress the page. Pre-encoded responses carry
+# Content-Encoding, which Flask-Compress leaves untouched.
+INDEX_ENCODINGS = ("br", "gzip")
+
+
+@functools.lru_cache(maxsize=None)
+def _index_page(encoding):
+    """Read ``index.html`` once per *encoding* and return its bytes with an ETag."""
+    with open(os.path.join(app.root_path, "index.html"), "rb") as fh:
+        body = fh.read()
+    if encoding == "br":
+        body = brotli.compress(body, quality=11)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=9, mtime=0)
+    return body, hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _index_encoding():
+    """Pick the first of ``INDEX_ENCODINGS`` the client accepts, else identity."""
+    accepted = request.accept_encodings
+    for encoding in INDEX_ENCODINGS:
+        if accepted[encoding]:
+            return encoding
+    return "identity"
+
+
 @app.route("/")
 def index():
-    return send_from_directory(app.root_path, "index.html")
+    encoding = _index_encoding()
+    body, etag = _index_page(encoding)
+    response = Response(body, mimetype="text/html")
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 
 @app.route("/api")
@@ -929,6 +1070,7 @@ def api_info():
                 "/api/generate-plan",
                 "/api/generate-system",
             ],
+            "cache_stats": "/api/cache/stats",
         },
         "features": [
             "JWT Authentication",
@@ -947,5 +1089,9 @@ def api_info():
 # ---------------------------------------------------------------------------
 
 if __name__ == "__main__":
+    logger.warning(
+        "Running the Werkzeug development server. For production use "
+        "`gunicorn -c gunicorn.conf.py app:app` (see DEPLOYMENT.md)."
+    )
     get_sqlite_connection().close()
     app.run(host="0.0.0.0", port=5000, debug=False)
@@ -0,0 +1,31 @@
+"""Gunicorn configuration for self-hosted deployments.
+
+Usage::
+
+    pip install gunicorn gevent
+    gunicorn -c gunicorn.conf.py app:app
+
+gevent workers patch blocking socket I/O so a single worker can serve many
+in-flight generation requests. lib/llm.py detects the patched sockets and
+talks to Gemini over REST, since the default gRPC transport would block the
+event loop. One worker per core is usually enough; raise
+``GUNICORN_WORKER_CONNECTIONS`` for more concurrency.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))
+# Only used by the gthread worker class (GUNICORN_WORKER_CLASS=gthread).
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Heartbeat files on tmpfs avoid worker stalls on slow container disks.
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# A full generate-system run chains several LLM calls.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
@@ -1,12 +1,25 @@
 """Multi-agent pipeline: Planner → Executor → Reviewer → Refactorer."""
 
-import json
+import hashlib
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
 
-from lib.llm import call_llm
+import orjson
+
+from lib.llm import DEFAULT_MODEL, call_llm
 
 logger = logging.getLogger(__name__)
 
+# LLM calls are network-bound, so independent per-file calls can overlap.
+MAX_LLM_WORKERS = 8
+
+# Opening fence line, body, and an optional closing fence on its own line.
+# ``(?<![^\n])`` means "preceded by a newline or at the start of the text", so
+# the closing fence must start a line; ``[^\S\n]*`` allows any indentation
+# other than a newline (including a stray ``\r``) before it.
+_FENCE_RE = re.compile(r"\A```[^\n]*\n?(.*?)(?:(?<![^\n])[^\S\n]*```)?\Z", re.DOTALL)
+
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -15,20 +28,22 @@ logger = logging.getLogger(__name__)
 def _clean_code_output(code_text):
     """Remove markdown code fences from LLM output."""
     code_text = code_text.strip()
-    if code_text.startswith("```"):
-        lines = code_text.split("\n")
-        lines = lines[1:]
-        if lines and lines[-1].strip() == "```":
-            lines = lines[:-1]
-        code_text = "\n".join(lines)
+    match = _FENCE_RE.match(code_text)
+    if match:
+        code_text = match.group(1)
     return code_text.strip()
 
 
+def _prompt_json(value):
+    """Serialize *value* compactly for embedding in a prompt."""
+    return orjson.dumps(value).decode()
+
+
 def _parse_json_response(text, fallback):
     """Try to parse *text* as JSON, returning *fallback* on failure."""
     try:
-        return json.loads(text)
-    except (json.JSONDecodeError, TypeError):
+        return orjson.loads(text)
+    except (orjson.JSONDecodeError, TypeError):
         return fallback
 
 
@@ -36,25 +51,68 @@ def _parse_json_response(text, fallback):
 # Planner Agent
 # ---------------------------------------------------------------------------
 
+# Prompt templates are built once. Static instructions come first and per-call
+# data is appended after the ``---`` marker, so every call of the same kind
+# shares a byte-identical prefix that provider-side prompt caching can reuse.
+_REFINE_PROMPT = (
+    "You are an expert system architect and prompt engineer. "
+    "Refine the user request below into a comprehensive, detailed "
+    "specification for building a software system.\n\n"
+    "Provide a refined specification that includes:\n"
+    "1. **Project Goal**: Clear, specific objective\n"
+    "2. **Target Audience**: Who will use this system\n"
+    "3. **Core Features**: Detailed list (minimum 5)\n"
+    "4. **Technical Requirements**: Language, framework, database, auth\n"
+    "5. **UI/UX Requirements**: Design style, responsiveness\n"
+    "6. **Constraints**: Hosting (Vercel), performance, scalability\n"
+    "7. **Success Criteria**: Measurable outcomes\n\n"
+    "Output as structured JSON with keys: goal, audience, features (array), "
+    "technical_requirements (object), ui_requirements (object), "
+    "constraints (array), success_criteria (array).\n\n"
+    "---\n"
+    "User Request:\n{user_input}{context_block}"
+)
+
+_PLAN_PROMPT = (
+    "You are a senior software architect. Create a detailed implementation "
+    "plan for the system specified below.\n\n"
+    "Include:\n"
+    "1. Architecture Overview\n"
+    "2. File Structure\n"
+    "3. Implementation Steps (minimum 8)\n"
+    "4. Technology Stack\n"
+    "5. Data Models\n"
+    "6. API Endpoints\n"
+    "7. Security Measures\n"
+    "8. Deployment Strategy (Vercel)\n"
+    "9. Testing Strategy\n"
+    "10. Risk Assessment\n\n"
+    "Output as detailed JSON.\n\n"
+    "---\n"
+    "Specification:\n{spec}"
+)
+
+# Bump when agent output changes for reasons outside the template text (e.g.
+# prompt serialization or sampling settings); cached results are keyed on it.
+PROMPT_CACHE_VERSION = 1
+
+
+def _cache_version(template):
+    """Return a short digest identifying *template* and the model it is sent to."""
+    return hashlib.blake2b(
+        f"{PROMPT_CACHE_VERSION}\0{DEFAULT_MODEL}\0{template}".encode(), digest_size=8
+    ).hexdigest()
+
+
+REFINE_CACHE_VERSION = _cache_version(_REFINE_PROMPT)
+PLAN_CACHE_VERSION = _cache_version(_PLAN_PROMPT)
+
+
 def refine_user_prompt(user_input, context=None):
     """Refine raw user input into a structured specification."""
-    prompt = (
-        "You are an expert system architect and prompt engineer. "
-        "Refine the following user request into a comprehensive, detailed "
-        "specification for building a software system.\n\n"
-        f"User Request:\n{user_input}\n\n"
-        + (f"Additional Context: {context}\n\n" if context else "")
-        + "Provide a refined specification that includes:\n"
-        "1. **Project Goal**: Clear, specific objective\n"
-        "2. **Target Audience**: Who will use this system\n"
-        "3. **Core Features**: Detailed list (minimum 5)\n"
-        "4. **Technical Requirements**: Language, framework, database, auth\n"
-        "5. **UI/UX Requirements**: Design style, responsiveness\n"
-        "6. **Constraints**: Hosting (Vercel), performance, scalability\n"
-        "7. **Success Criteria**: Measurable outcomes\n\n"
-        "Output as structured JSON with keys: goal, audience, features (array), "
-        "technical_requirements (object), ui_requirements (object), "
-        "constraints (array), success_criteria (array)."
+    prompt = _REFINE_PROMPT.format(
+        user_input=user_input,
+        context_block=f"\n\nAdditional Context: {context}" if context else "",
     )
     response = call_llm(prompt, temperature=0.3)
     return _parse_json_response(response, {
@@ -70,23 +128,7 @@ def refine_user_prompt(user_input, context=None):
 
 def create_system_plan(refined_spec):
     """Create a detailed implementation plan from a refined specification."""
-    spec_str = json.dumps(refined_spec, indent=2)
-    prompt = (
-        "You are a senior software architect. Create a detailed implementation "
-        f"plan for this system:\n\n{spec_str}\n\n"
-        "Include:\n"
-        "1. Architecture Overview\n"
-        "2. File Structure\n"
-        "3. Implementation Steps (minimum 8)\n"
-        "4. Technology Stack\n"
-        "5. Data Models\n"
-        "6. API Endpoints\n"
-        "7. Security Measures\n"
-        "8. Deployment Strategy (Vercel)\n"
-        "9. Testing Strategy\n"
-        "10. Risk Assessment\n\n"
-        "Output as detailed JSON."
-    )
+    prompt = _PLAN_PROMPT.format(spec=_prompt_json(refined_spec))
     response = call_llm(prompt, temperature=0.2, max_tokens=6000)
     return _parse_json_response(response, {
         "architecture": "Modern web application",
@@ -101,66 +143,87 @@ def create_system_plan(refined_spec):
 # Executor Agent
 # ---------------------------------------------------------------------------
 
+# Supporting files that are identical for every generated project.
+_GENERATED_REQUIREMENTS = (
+    "Flask==3.0.3\nFlask-CORS==5.0.0\nflask-limiter>=2.9,<3.0\n"
+    "PyJWT==2.8.0\ngoogle-generativeai==0.8.3\nsupabase>=2.11.0,<3.0.0\n"
+    "python-dotenv==1.0.0\n"
+)
+
+_GENERATED_VERCEL_JSON = orjson.dumps(
+    {
+        "version": 2,
+        "builds": [{"src": "app.py", "use": "@vercel/python"}],
+        "routes": [{"src": "/(.*)", "dest": "app.py"}],
+        "env": {
+            "GEMINI_KEY": "@gemini_key",
+            "SUPABASE_URL": "@supabase_url",
+            "SUPABASE_KEY": "@supabase_key",
+            "JWT_SECRET": "@jwt_secret",
+        },
+    },
+    option=orjson.OPT_INDENT_2,
+).decode()
+
+_GENERATED_README_FOOTER = (
+    "\n\n## Quick Start\n```bash\npip install -r requirements.txt\npython app.py\n```\n\n"
+    "## Deploy\n```bash\nvercel --prod\n```\n\n"
+    "*Generated by Agentic System Builder*\n"
+)
+
+_GENERATED_ENV_EXAMPLE = (
+    "GEMINI_KEY=your_gemini_api_key_here\n"
+    "SUPABASE_URL=your_supabase_project_url\n"
+    "SUPABASE_KEY=your_supabase_anon_key\n"
+    "JWT_SECRET=your_random_secret_key_min_32_chars\n"
+)
+
+_BACKEND_PROMPT = (
+    "Generate a complete, production-ready Flask backend (app.py) for the "
+    "plan and spec below.\n"
+    "Requirements: Flask, JWT auth, Supabase, env vars, CORS, rate limiting.\n"
+    "Output ONLY the complete Python code.\n\n"
+    "---\n"
+    "Plan: {plan}\nSpec: {spec}"
+)
+
+_FRONTEND_PROMPT = (
+    "Generate a complete, mobile-first web interface for the plan and spec below.\n"
+    "Requirements: Single HTML, responsive, dark theme, API integration, JWT auth.\n"
+    "Output ONLY the complete HTML code.\n\n"
+    "---\n"
+    "Plan: {plan}\nSpec: {spec}"
+)
+
+
 def generate_project_files(plan, refined_spec):
     """Generate all code files for a project."""
     files = {}
-
-    # Backend
-    backend_prompt = (
-        "Generate a complete, production-ready Flask backend (app.py):\n\n"
-        f"Plan: {json.dumps(plan, indent=2)}\nSpec: {json.dumps(refined_spec, indent=2)}\n\n"
-        "Requirements: Flask, JWT auth, Supabase, env vars, CORS, rate limiting.\n"
-        "Output ONLY the complete Python code."
-    )
-    files["app.py"] = _clean_code_output(call_llm(backend_prompt, max_tokens=8000))
-
-    # Frontend
-    frontend_prompt = (
-        "Generate a complete, mobile-first web interface:\n\n"
-        f"Plan: {json.dumps(plan, indent=2)}\nSpec: {json.dumps(refined_spec, indent=2)}\n\n"
-        "Requirements: Single HTML, responsive, dark theme, API integration, JWT auth.\n"
-        "Output ONLY the complete HTML code."
-    )
-    files["index.html"] = _clean_code_output(call_llm(frontend_prompt, max_tokens=8000))
+    plan_str = _prompt_json(plan)
+    spec_str = _prompt_json(refined_spec)
+    backend_prompt = _BACKEND_PROMPT.format(plan=plan_str, spec=spec_str)
+    frontend_prompt = _FRONTEND_PROMPT.format(plan=plan_str, spec=spec_str)
+
+    # The two code files are independent, so generate them concurrently.
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        backend = pool.submit(call_llm, backend_prompt, max_tokens=8000)
+        frontend = pool.submit(call_llm, frontend_prompt, max_tokens=8000)
+        files["app.py"] = _clean_code_output(backend.result())
+        files["index.html"] = _clean_code_output(frontend.result())
 
     # Supporting files
-    files["requirements.txt"] = (
-        "Flask==3.0.3\nFlask-CORS==5.0.0\nflask-limiter>=2.9,<3.0\n"
-        "PyJWT==2.8.0\ngoogle-generativeai==0.8.3\nsupabase>=2.11.0,<3.0.0\n"
-        "python-dotenv==1.0.0\n"
-    )
-
-    files["vercel.json"] = json.dumps(
-        {
-            "version": 2,
-            "builds": [{"src": "app.py", "use": "@vercel/python"}],
-            "routes": [{"src": "/(.*)", "dest": "app.py"}],
-            "env": {
-                "GEMINI_KEY": "@gemini_key",
-                "SUPABASE_URL": "@supabase_url",
-                "SUPABASE_KEY": "@supabase_key",
-                "JWT_SECRET": "@jwt_secret",
-            },
-        },
-        indent=2,
-    )
+    files["requirements.txt"] = _GENERATED_REQUIREMENTS
+    files["vercel.json"] = _GENERATED_VERCEL_JSON
 
     goal = refined_spec.get("goal", "Generated System")
     features = refined_spec.get("features", [])
     files["README.md"] = (
         f"# {goal}\n\n## Features\n"
         + "\n".join(f"- {f}" for f in features)
-        + "\n\n## Quick Start\n```bash\npip install -r requirements.txt\npython app.py\n```\n\n"
-        "## Deploy\n```bash\nvercel --prod\n```\n\n"
-        "*Generated by Agentic System Builder*\n"
+        + _GENERATED_README_FOOTER
     )
 
-    files[".env.example"] = (
-        "GEMINI_KEY=your_gemini_api_key_here\n"
-        "SUPABASE_URL=your_supabase_project_url\n"
-        "SUPABASE_KEY=your_supabase_anon_key\n"
-        "JWT_SECRET=your_random_secret_key_min_32_chars\n"
-    )
+    files[".env.example"] = _GENERATED_ENV_EXAMPLE
 
     return files
 
@@ -169,16 +232,20 @@ def generate_project_files(plan, refined_spec):
 # Reviewer Agent
 # ---------------------------------------------------------------------------
 
+_REVIEW_PROMPT = (
+    "You are a senior code reviewer. Review the system described below.\n"
+    "Review for: security, quality, completeness, best practices, Vercel readiness.\n"
+    "Output JSON: overall_score (0-100), security_issues, quality_issues, "
+    "missing_features, recommendations, deployment_ready, summary.\n\n"
+    "---\n"
+    "Files:\n{summary}\n\nPlan:\n{plan}..."
+)
+
+
 def review_generated_code(files, plan, refined_spec):
     """Review generated code for quality and security."""
     summary = "\n".join(f"- {n} ({len(c)} chars)" for n, c in files.items())
-    prompt = (
-        "You are a senior code reviewer. Review this system:\n\n"
-        f"Files:\n{summary}\n\nPlan:\n{json.dumps(plan, indent=2)[:1000]}...\n\n"
-        "Review for: security, quality, completeness, best practices, Vercel readiness.\n"
-        "Output JSON: overall_score (0-100), security_issues, quality_issues, "
-        "missing_features, recommendations, deployment_ready, summary."
-    )
+    prompt = _REVIEW_PROMPT.format(summary=summary, plan=_prompt_json(plan)[:1000])
     response = call_llm(prompt, temperature=0.3)
     return _parse_json_response(response, {
         "overall_score": 75,
@@ -196,6 +263,15 @@ def review_generated_code(files, plan, refined_spec):
 # Refactorer Agent
 # ---------------------------------------------------------------------------
 
+_REFACTOR_PROMPT = (
+    "Refactor the code below to fix the listed issues.\n"
+    "Output ONLY the complete refactored code.\n\n"
+    "---\n"
+    "Issues:\n{issues}\n\n"
+    "Code:\n```\n{code}\n```"
+)
+
+
 def refactor_code(files, review_feedback):
     """Apply improvements based on review feedback."""
     if review_feedback.get("overall_score", 100) >= 90:
@@ -207,23 +283,22 @@ def refactor_code(files, review_feedback):
     if not issues:
         return files, "No critical issues to refactor"
 
-    refactored = {}
-    for filename in ["app.py", "index.html"]:
-        if filename not in files:
-            continue
-        prompt = (
-            "Refactor this code to fix:\n"
-            + "\n".join(f"- {i}" for i in issues[:5])
-            + f"\n\nCode:\n```\n{files[filename][:4000]}\n```\n"
-            "Output ONLY the complete refactored code."
-        )
+    targets = [name for name in ("app.py", "index.html") if name in files]
+    # Issues may be dicts, so dedupe on the rendered lines (order preserved).
+    issue_lines = "\n".join(list(dict.fromkeys(f"- {i}" for i in issues))[:5])
+
+    def _refactor_one(filename):
+        prompt = _REFACTOR_PROMPT.format(issues=issue_lines, code=files[filename][:4000])
         try:
-            refactored[filename] = _clean_code_output(
-                call_llm(prompt, max_tokens=8000)
-            )
+            return _clean_code_output(call_llm(prompt, max_tokens=8000))
         except Exception as exc:
             logger.error("Refactoring failed for %s: %s", filename, exc)
-            refactored[filename] = files[filename]
+            return files[filename]
+
+    refactored = {}
+    if targets:
+        with ThreadPoolExecutor(max_workers=min(MAX_LLM_WORKERS, len(targets))) as pool:
+            refactored = dict(zip(targets, pool.map(_refactor_one, targets)))
 
     for name, content in files.items():
         if name not in refactored:
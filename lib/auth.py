@@ -2,30 +2,34 @@
 
 import os
 import threading
-from datetime import datetime, timedelta, timezone
-from functools import wraps
+import time
+from functools import lru_cache, wraps
 
 import jwt
 from flask import request
 
-_jwt_secret_cache = None
-_jwt_secret_lock = threading.Lock()
 
+@lru_cache(maxsize=None)
 def _get_jwt_secret():
-    """Get JWT_SECRET from environment (cached, thread-safe), raising an error if not set."""
-    global _jwt_secret_cache
-    if _jwt_secret_cache is None:
-        with _jwt_secret_lock:
-            # Double-check pattern to avoid race condition
-            if _jwt_secret_cache is None:
-                secret = os.getenv("JWT_SECRET")
-                if not secret:
-                    raise RuntimeError("JWT_SECRET environment variable must be set")
-                _jwt_secret_cache = secret
-    return _jwt_secret_cache
+    """Get JWT_SECRET from environment (cached after first success), raising an error if not set."""
+    secret = os.getenv("JWT_SECRET")
+    if not secret:
+        raise RuntimeError("JWT_SECRET environment variable must be set")
+    return secret
+
 
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+_JWT_ALGORITHMS = (JWT_ALGORITHM,)
+
+# Reused codec instance; avoids rebuilding the PyJWT wrapper on every call.
+_jwt = jwt.PyJWT()
+
+# Verified tokens are cached briefly so repeat requests skip signature checks.
+TOKEN_CACHE_TTL = 60  # seconds
+TOKEN_CACHE_MAX_SIZE = 4096
+_token_cache = {}
+_token_cache_lock = threading.Lock()
 
 
 class ApiError(Exception):
@@ -39,40 +43,61 @@ class ApiError(Exception):
 
 def generate_token(user_id, email):
     """Create a signed JWT for the given user."""
+    now = int(time.time())
     payload = {
         "user_id": user_id,
         "email": email,
-        "exp": datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS),
-        "iat": datetime.now(timezone.utc),
+        "exp": now + JWT_EXPIRATION_HOURS * 3600,
+        "iat": now,
     }
-    return jwt.encode(payload, _get_jwt_secret(), algorithm=JWT_ALGORITHM)
+    return _jwt.encode(payload, _get_jwt_secret(), algorithm=JWT_ALGORITHM)
 
 
 def verify_token(token):
-    """Decode and validate a JWT. Raises *ApiError* on failure."""
+    """Decode and validate a JWT. Raises *ApiError* on failure.
+
+    Successful results are cached for up to ``TOKEN_CACHE_TTL`` seconds,
+    never beyond the token's own expiry.
+    """
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(token)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
     try:
-        return jwt.decode(token, _get_jwt_secret(), algorithms=[JWT_ALGORITHM])
+        payload = _jwt.decode(token, _get_jwt_secret(), algorithms=_JWT_ALGORITHMS)
     except jwt.ExpiredSignatureError:
         raise ApiError("Token has expired", 401)
     except jwt.InvalidTokenError:
         raise ApiError("Invalid token", 401)
 
+    expires_at = min(now + TOKEN_CACHE_TTL, payload.get("exp", now))
+    with _token_cache_lock:
+        _token_cache.pop(token, None)
+        if len(_token_cache) >= TOKEN_CACHE_MAX_SIZE:
+            # Evict the oldest entry (dicts preserve insertion order).
+            _token_cache.pop(next(iter(_token_cache)))
+        _token_cache[token] = (expires_at, payload)
+    return payload
+
 
 def generate_password_reset_token(email):
     """Create a short-lived token for password reset."""
+    now = int(time.time())
     payload = {
         "email": email,
         "purpose": "password_reset",
-        "exp": datetime.now(timezone.utc) + timedelta(hours=1),
-        "iat": datetime.now(timezone.utc),
+        "exp": now + 3600,
+        "iat": now,
     }
-    return jwt.encode(payload, _get_jwt_secret(), algorithm=JWT_ALGORITHM)
+    return _jwt.encode(payload, _get_jwt_secret(), algorithm=JWT_ALGORITHM)
 
 
 def verify_password_reset_token(token):
     """Decode and validate a password reset token. Raises *ApiError* on failure."""
     try:
-        payload = jwt.decode(token, _get_jwt_secret(), algorithms=[JWT_ALGORITHM])
+        payload = _jwt.decode(token, _get_jwt_secret(), algorithms=_JWT_ALGORITHMS)
         if payload.get("purpose") != "password_reset":
             raise ApiError("Invalid token purpose", 401)
         return payload
@@ -91,7 +116,7 @@ def require_auth(f):
         if not auth_header.startswith("Bearer "):
             raise ApiError("Missing or invalid authorization header", 401)
 
-        token = auth_header.replace("Bearer ", "", 1).strip()
+        token = auth_header[7:].strip()  # len("Bearer ")
         payload = verify_token(token)
         request.user_id = payload["user_id"]
         request.user_email = payload["email"]
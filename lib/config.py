@@ -0,0 +1,26 @@
+"""Environment configuration, read once at import.
+
+Secrets that are validated on first request (``JWT_SECRET``) are still looked
+up lazily by their owners.
+"""
+
+import os
+
+_env = os.environ
+
+SUPABASE_URL = _env.get("SUPABASE_URL")
+SUPABASE_KEY = _env.get("SUPABASE_KEY")
+GEMINI_KEY = _env.get("GEMINI_KEY")
+SECRET_KEY = _env.get("SECRET_KEY")
+
+ALLOWED_ORIGINS = _env.get("ALLOWED_ORIGINS", "*").split(",")
+# Rate-limit storage; set REDIS_URL to share counters across workers.
+RATELIMIT_STORAGE_URI = _env.get("REDIS_URL", "memory://")
+
+IS_VERCEL = bool(_env.get("VERCEL") or _env.get("VERCEL_ENV"))
+TMP_BASE = "/tmp" if IS_VERCEL else "."
+SQLITE_PATH = _env.get("SQLITE_PATH", os.path.join(TMP_BASE, "data", "agentic.db"))
+DATA_ROOT = _env.get("DATA_ROOT", os.path.join(TMP_BASE, "generated"))
+SQLITE_POOL_SIZE = int(_env.get("SQLITE_POOL_SIZE", "8"))
+
+LLM_REQUEST_TIMEOUT = float(_env.get("LLM_REQUEST_TIMEOUT", "70"))
@@ -1,30 +1,49 @@
 """Database connections for SQLite and Supabase."""
 
+import contextlib
 import importlib.util
 import logging
-import os
 import pathlib
+import queue
 import sqlite3
+import threading
+import time
 
-logger = logging.getLogger(__name__)
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-GEMINI_KEY = os.getenv("GEMINI_KEY")
+from lib.config import (
+    DATA_ROOT,
+    SQLITE_PATH,
+    SQLITE_POOL_SIZE,
+    SUPABASE_KEY,
+    SUPABASE_URL,
+    TMP_BASE,
+)
 
-_is_vercel = bool(os.getenv("VERCEL") or os.getenv("VERCEL_ENV"))
-_tmp_base = "/tmp" if _is_vercel else "."
-SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(_tmp_base, "data", "agentic.db"))
-DATA_ROOT = os.getenv("DATA_ROOT", os.path.join(_tmp_base, "generated"))
+logger = logging.getLogger(__name__)
 
 FS_BASE_DIR = pathlib.Path(DATA_ROOT).resolve()
 try:
     FS_BASE_DIR.mkdir(parents=True, exist_ok=True)
 except OSError:
-    FS_BASE_DIR = pathlib.Path(_tmp_base, "generated").resolve()
+    FS_BASE_DIR = pathlib.Path(TMP_BASE, "generated").resolve()
     FS_BASE_DIR.mkdir(parents=True, exist_ok=True)
 
 _supabase_client = None
+_supabase_lock = threading.Lock()
+
+WAL_CHECKPOINT_INTERVAL = 30  # seconds
+AGENT_CACHE_TTL = 24 * 3600  # seconds a prompt_cache row stays valid
+CACHE_PRUNE_INTERVAL = 600  # seconds between deletes of stale cache rows
+ANALYZE_INTERVAL = 3600  # seconds between planner statistics refreshes
+SQLITE_ANALYSIS_LIMIT = 400  # rows sampled per index by ANALYZE
+_checkpoint_thread = None
+_checkpoint_lock = threading.Lock()
+
+SQLITE_STATEMENT_CACHE_SIZE = 256
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # bytes of the database file to memory-map
+SQLITE_CACHE_SIZE_KIB = 8 * 1024  # page cache per pooled connection
+_sqlite_path = None
+_schema_lock = threading.Lock()
+_pools = {False: queue.LifoQueue(SQLITE_POOL_SIZE), True: queue.LifoQueue(SQLITE_POOL_SIZE)}
 
 _SCHEMA_SQL = [
     """CREATE TABLE IF NOT EXISTS users (
@@ -50,8 +69,10 @@ _SCHEMA_SQL = [
         updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
     )""",
-    """CREATE INDEX IF NOT EXISTS idx_projects_user_id ON projects(user_id)""",
+    # Covered by idx_projects_user_updated (same leading column).
+    """DROP INDEX IF EXISTS idx_projects_user_id""",
     """CREATE INDEX IF NOT EXISTS idx_projects_status ON projects(status)""",
+    """CREATE INDEX IF NOT EXISTS idx_projects_user_updated ON projects(user_id, updated_at DESC)""",
     """CREATE TABLE IF NOT EXISTS generated_files (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         project_id INTEGER NOT NULL,
@@ -86,41 +107,202 @@ _SCHEMA_SQL = [
     )""",
     """CREATE INDEX IF NOT EXISTS idx_project_collaborators_project_id ON project_collaborators(project_id)""",
     """CREATE INDEX IF NOT EXISTS idx_project_collaborators_user_id ON project_collaborators(user_id)""",
+    """CREATE TABLE IF NOT EXISTS prompt_cache (
+        hash BLOB PRIMARY KEY,
+        result BLOB NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )""",
 ]
 
+_SCHEMA_DDL = "BEGIN;\n" + ";\n".join(_SCHEMA_SQL) + ";\nCOMMIT;"
+
 
 def get_supabase_client():
-    """Return a cached Supabase client, or *None* when unavailable."""
+    """Return the process-wide Supabase client, or *None* when unavailable."""
     global _supabase_client
     if _supabase_client is not None:
         return _supabase_client
     if not (SUPABASE_URL and SUPABASE_KEY):
         return None
-    try:
-        if importlib.util.find_spec("supabase") is None:
-            return None
-        from supabase import create_client
+    with _supabase_lock:
+        if _supabase_client is not None:
+            return _supabase_client
+        try:
+            if importlib.util.find_spec("supabase") is None:
+                return None
+            from supabase import create_client
 
-        _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        return _supabase_client
-    except Exception as exc:
-        logger.warning("Supabase unavailable: %s", exc)
-        return None
+            _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+            return _supabase_client
+        except Exception as exc:
+            logger.warning("Supabase unavailable: %s", exc)
+            return None
 
 
-def get_sqlite_connection():
-    """Return an initialised SQLite connection with all tables created."""
+def _resolve_sqlite_path():
+    """Return the SQLite database path, falling back to the temp base dir."""
     sqlite_path = pathlib.Path(SQLITE_PATH)
     try:
         sqlite_path.parent.mkdir(parents=True, exist_ok=True)
     except OSError:
-        sqlite_path = pathlib.Path(_tmp_base, "data", "agentic.db")
+        sqlite_path = pathlib.Path(TMP_BASE, "data", "agentic.db")
         sqlite_path.parent.mkdir(parents=True, exist_ok=True)
+    return sqlite_path
+
+
+def _checkpoint_loop(sqlite_path):
+    """Periodically fold the WAL back into the main database file.
+
+    Expired ``prompt_cache`` rows are deleted every ``CACHE_PRUNE_INTERVAL``,
+    and planner statistics are refreshed with a sampled ``ANALYZE`` every
+    ``ANALYZE_INTERVAL`` (first run after one interval, once data exists).
+    """
+    next_prune = time.monotonic()
+    next_analyze = time.monotonic() + ANALYZE_INTERVAL
+    while True:
+        time.sleep(WAL_CHECKPOINT_INTERVAL)
+        try:
+            conn = sqlite3.connect(sqlite_path)
+            try:
+                if time.monotonic() >= next_prune:
+                    conn.execute(
+                        "DELETE FROM prompt_cache WHERE created_at < datetime('now', ?)",
+                        (f"-{AGENT_CACHE_TTL} seconds",),
+                    )
+                    conn.commit()
+                    next_prune = time.monotonic() + CACHE_PRUNE_INTERVAL
+                if time.monotonic() >= next_analyze:
+                    conn.execute(f"PRAGMA analysis_limit={SQLITE_ANALYSIS_LIMIT}")
+                    conn.execute("ANALYZE")
+                    conn.commit()
+                    next_analyze = time.monotonic() + ANALYZE_INTERVAL
+                conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            finally:
+                conn.close()
+        except sqlite3.Error as exc:
+            logger.warning("WAL checkpoint failed: %s", exc)
+
+
+def _start_checkpointer(sqlite_path):
+    """Start the background WAL checkpoint thread once per process."""
+    global _checkpoint_thread
+    if _checkpoint_thread is not None:
+        return
+    with _checkpoint_lock:
+        if _checkpoint_thread is None:
+            _checkpoint_thread = threading.Thread(
+                target=_checkpoint_loop,
+                args=(sqlite_path,),
+                name="sqlite-wal-checkpoint",
+                daemon=True,
+            )
+            _checkpoint_thread.start()
+
+
+def _init_schema():
+    """Create all tables once per process and return the database path."""
+    global _sqlite_path
+    if _sqlite_path is not None:
+        return _sqlite_path
+    with _schema_lock:
+        if _sqlite_path is None:
+            sqlite_path = _resolve_sqlite_path()
+            conn = sqlite3.connect(sqlite_path)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA_DDL)
+            finally:
+                conn.close()
+            _start_checkpointer(sqlite_path)
+            _sqlite_path = sqlite_path
+    return _sqlite_path
 
-    conn = sqlite3.connect(sqlite_path)
-    conn.row_factory = sqlite3.Row
 
-    for statement in _SCHEMA_SQL:
-        conn.execute(statement)
-    conn.commit()
+def get_sqlite_connection(read_only=False):
+    """Open a new SQLite connection to the initialised database.
+
+    With *read_only* the connection runs in autocommit mode with
+    ``PRAGMA query_only`` set; callers open an explicit ``BEGIN DEFERRED``
+    so the read snapshot is taken only when the first SELECT runs.
+
+    Request handlers should prefer :func:`borrow_connection`, which reuses
+    pooled connections instead of opening the database file every time.
+    """
+    sqlite_path = _init_schema()
+
+    conn = sqlite3.connect(
+        sqlite_path,
+        isolation_level=None if read_only else "",
+        check_same_thread=False,
+        cached_statements=SQLITE_STATEMENT_CACHE_SIZE,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}")
+    if read_only:
+        conn.execute("PRAGMA query_only=1")
     return conn
+
+
+@contextlib.contextmanager
+def borrow_connection(read_only=False):
+    """Borrow a pooled SQLite connection for the duration of a ``with`` block.
+
+    Any transaction still open when the block exits is rolled back, matching
+    the previous close-without-commit behaviour. Up to ``SQLITE_POOL_SIZE``
+    idle connections are kept per mode; extras are closed.
+    """
+    pool = _pools[read_only]
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = get_sqlite_connection(read_only=read_only)
+
+    try:
+        yield conn
+    finally:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            pool.put_nowait(conn)
+        except (sqlite3.Error, queue.Full):
+            conn.close()
+
+
+def rows_to_dicts(cursor):
+    """Fetch all rows from *cursor* as dicts, resolving column names once."""
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def file_extension(filename):
+    """Return the extension of *filename* (without the dot), or ``"txt"``."""
+    i = filename.rfind(".")
+    return filename[i + 1:] if i >= 0 else "txt"
+
+
+def insert_generated_files(conn, project_id, files):
+    """Bulk-insert *files* (filename → content) for *project_id* on *conn*.
+
+    Uses a single ``executemany`` inside the caller's transaction; the caller
+    is responsible for committing.
+    """
+    conn.executemany(
+        "INSERT INTO generated_files (project_id, filename, content, file_type) VALUES (?, ?, ?, ?)",
+        [(project_id, name, content, file_extension(name)) for name, content in files.items()],
+    )
+
+
+def insert_collaborators(conn, project_id, collaborators):
+    """Bulk-insert ``(user_id, role)`` pairs as collaborators of *project_id* on *conn*.
+
+    Uses a single ``executemany`` inside the caller's transaction; the caller
+    is responsible for committing. Raises ``sqlite3.IntegrityError`` if a
+    user is already a collaborator.
+    """
+    conn.executemany(
+        "INSERT INTO project_collaborators (project_id, user_id, role) VALUES (?, ?, ?)",
+        [(project_id, user_id, role) for user_id, role in collaborators],
+    )
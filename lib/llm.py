@@ -1,34 +1,90 @@
 """LLM integration – Google Gemini."""
 
+import hashlib
 import logging
-import os
+import re
+import sqlite3
+import sys
+import threading
+import time
 
 import google.generativeai as genai
+import orjson
+from google.api_core import retry as api_retry
 
 from lib.auth import ApiError
+from lib.config import GEMINI_KEY, LLM_REQUEST_TIMEOUT
+from lib.database import AGENT_CACHE_TTL, borrow_connection
 
 logger = logging.getLogger(__name__)
 
-GEMINI_KEY = os.getenv("GEMINI_KEY")
+
+def _gemini_transport():
+    """Return the SDK transport to use in this process.
+
+    gRPC's C core is not gevent-aware: a blocking call would stall the whole
+    event loop of a gevent worker. When sockets are monkey-patched, use the
+    REST transport instead, whose HTTP calls yield to other greenlets.
+    """
+    monkey = sys.modules.get("gevent.monkey")
+    if monkey is not None and monkey.is_module_patched("socket"):
+        return "rest"
+    return "grpc"
+
+
 if GEMINI_KEY:
-    genai.configure(api_key=GEMINI_KEY)
+    # The SDK keeps one process-wide client per transport, so every agent
+    # call reuses the same long-lived channel/session (no per-call TLS setup).
+    genai.configure(api_key=GEMINI_KEY, transport=_gemini_transport())
+
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+
+# Per-attempt timeout plus a bounded retry on transient errors (429/5xx) so a
+# stalled call cannot hold a worker indefinitely. Retries only start within
+# LLM_RETRY_WINDOW, so one call takes at most about LLM_RETRY_WINDOW +
+# LLM_REQUEST_TIMEOUT (~90 s by default); generate-system's three sequential
+# stages then fit within the 300 s Gunicorn and proxy timeouts.
+LLM_RETRY_WINDOW = 20.0  # seconds
+LLM_RETRY = api_retry.Retry(initial=1.0, maximum=8.0, multiplier=2.0, timeout=LLM_RETRY_WINDOW)
 
+# GenerativeModel objects are reused per (model, temperature, max_tokens); the
+# agents only use a handful of combinations.
+_models = {}
+_models_lock = threading.Lock()
 
-def call_llm(prompt, model="gemini-1.5-flash", temperature=0.7, max_tokens=4000):
+
+def _get_model(model, temperature, max_tokens):
+    """Return a cached ``GenerativeModel`` for the given generation settings."""
+    key = (model, temperature, max_tokens)
+    model_obj = _models.get(key)
+    if model_obj is None:
+        with _models_lock:
+            model_obj = _models.get(key)
+            if model_obj is None:
+                model_obj = genai.GenerativeModel(
+                    model,
+                    generation_config={
+                        "temperature": temperature,
+                        "max_output_tokens": max_tokens,
+                    },
+                )
+                _models[key] = model_obj
+    return model_obj
+
+
+def call_llm(prompt, model=DEFAULT_MODEL, temperature=0.7, max_tokens=4000):
     """Send a prompt to the configured LLM and return the text response."""
     if not prompt:
         raise ApiError("Prompt is required for LLM call")
 
     try:
         if model.startswith("gemini") and GEMINI_KEY:
-            model_obj = genai.GenerativeModel(
-                model,
-                generation_config={
-                    "temperature": temperature,
-                    "max_output_tokens": max_tokens,
-                },
+            model_obj = _get_model(model, temperature, max_tokens)
+            response = model_obj.generate_content(
+                prompt,
+                request_options={"timeout": LLM_REQUEST_TIMEOUT, "retry": LLM_RETRY},
             )
-            response = model_obj.generate_content(prompt)
             return response.text
         raise ApiError("No LLM model configured. Please set GEMINI_KEY.")
     except ApiError:
@@ -36,3 +92,105 @@ def call_llm(prompt, model="gemini-1.5-flash", temperature=0.7, max_tokens=4000)
     except Exception as exc:
         logger.exception("LLM call failed")
         raise ApiError(f"LLM error: {exc}", 500) from exc
+
+
+# ---------------------------------------------------------------------------
+# Agent result cache
+# ---------------------------------------------------------------------------
+
+# The only response cache: parsed agent results, never raw LLM text, so a
+# fallback built from unparseable output is not pinned. Hits are answered from
+# memory, then from the prompt_cache table (shared across workers and
+# restarts, pruned by lib.database after AGENT_CACHE_TTL).
+AGENT_CACHE_MAX_SIZE = 256
+_WHITESPACE_RE = re.compile(r"\s+")
+_agent_cache = {}
+_agent_cache_lock = threading.Lock()
+# Per-process counters reported by agent_cache_stats().
+_agent_cache_counts = {"memory_hits": 0, "db_hits": 0, "misses": 0, "bypassed": 0}
+
+
+def _count(event):
+    """Increment the *event* counter."""
+    with _agent_cache_lock:
+        _agent_cache_counts[event] += 1
+
+
+def _memory_put(key, payload, expires_at):
+    """Store serialized *payload* in the in-process tier, evicting the oldest entry when full."""
+    with _agent_cache_lock:
+        _agent_cache.pop(key, None)
+        if len(_agent_cache) >= AGENT_CACHE_MAX_SIZE:
+            _agent_cache.pop(next(iter(_agent_cache)))
+        _agent_cache[key] = (expires_at, payload)
+
+
+def cached_agent_call(kind, agent_fn, *args, version="", no_cache=False):
+    """Run *agent_fn* with *args*, memoized in memory and the ``prompt_cache`` table.
+
+    Keys are SHA-256 digests of the canonicalized arguments (string
+    arguments with whitespace runs collapsed), so requests that differ only
+    in spacing skip the LLM round-trip entirely. *agent_fn* still receives
+    the original arguments. *version* identifies the prompt template and
+    model behind *agent_fn*, so results cached under an older prompt are not
+    served after it changes. Cache failures are logged and never fail the call.
+    With *no_cache* the cache is neither read nor written, forcing a fresh
+    result.
+    """
+    if no_cache:
+        _count("bypassed")
+        return agent_fn(*args)
+
+    key_args = [_WHITESPACE_RE.sub(" ", a).strip() if isinstance(a, str) else a for a in args]
+    key = hashlib.sha256(
+        orjson.dumps([kind, version, *key_args], option=orjson.OPT_SORT_KEYS)
+    ).digest()
+
+    with _agent_cache_lock:
+        cached = _agent_cache.get(key)
+    if cached is not None and cached[0] > time.time():
+        _count("memory_hits")
+        return orjson.loads(cached[1])
+
+    try:
+        with borrow_connection(read_only=True) as conn:
+            row = conn.execute(
+                "SELECT result, CAST(strftime('%s', created_at) AS INTEGER) AS created "
+                "FROM prompt_cache WHERE hash = ? AND created_at >= datetime('now', ?)",
+                (key, f"-{AGENT_CACHE_TTL} seconds"),
+            ).fetchone()
+    except sqlite3.Error as exc:
+        logger.warning("Agent cache lookup failed: %s", exc)
+        row = None
+    if row:
+        # Keep the row's own expiry so promotion does not extend its lifetime.
+        _memory_put(key, row["result"], row["created"] + AGENT_CACHE_TTL)
+        _count("db_hits")
+        return orjson.loads(row["result"])
+
+    _count("misses")
+    result = agent_fn(*args)
+
+    # Fallbacks built from unparseable LLM output carry a raw_* key; don't pin them.
+    if isinstance(result, dict) and not any(k.startswith("raw_") for k in result):
+        payload = orjson.dumps(result)
+        _memory_put(key, payload, time.time() + AGENT_CACHE_TTL)
+        try:
+            with borrow_connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO prompt_cache (hash, result) VALUES (?, ?)",
+                    (key, payload),
+                )
+                conn.commit()
+        except sqlite3.Error as exc:
+            logger.warning("Agent cache write failed: %s", exc)
+    return result
+
+
+def agent_cache_stats():
+    """Return this process's agent cache counters and the ``prompt_cache`` row count."""
+    with _agent_cache_lock:
+        stats = dict(_agent_cache_counts, memory_entries=len(_agent_cache))
+    with borrow_connection(read_only=True) as conn:
+        stats["prompt_cache_rows"] = conn.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()[0]
+    return stats
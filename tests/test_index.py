@@ -0,0 +1,76 @@
+"""Conditional GET for the pre-compressed index page."""
+
+import gzip
+import os
+import tempfile
+
+import pytest
+
+try:
+    import brotlicffi as brotli
+except ImportError:
+    import brotli
+
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("SQLITE_PATH", os.path.join(_tmp, "agentic.db"))
+os.environ.setdefault("DATA_ROOT", os.path.join(_tmp, "generated"))
+# Required by the app's first-request environment check; never used here.
+os.environ.setdefault("GEMINI_KEY", "test-key")
+os.environ.setdefault("JWT_SECRET", "x" * 32)
+
+from app import app  # noqa: E402
+
+with open(os.path.join(app.root_path, "index.html"), "rb") as fh:
+    INDEX_HTML = fh.read()
+
+DECODERS = {
+    "br": brotli.decompress,
+    "gzip": gzip.decompress,
+    None: lambda body: body,
+}
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.mark.parametrize("accept, encoding", [("br", "br"), ("gzip", "gzip"), ("identity", None)])
+def test_index_serves_encoded_page(client, accept, encoding):
+    response = client.get("/", headers={"Accept-Encoding": accept})
+    assert response.status_code == 200
+    assert response.headers.get("Content-Encoding") == encoding
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert DECODERS[encoding](response.data) == INDEX_HTML
+
+
+@pytest.mark.parametrize("accept", ["br", "gzip, deflate, br", "identity"])
+def test_index_revalidation_returns_304(client, accept):
+    first = client.get("/", headers={"Accept-Encoding": accept})
+    etag = first.headers["ETag"]
+
+    second = client.get("/", headers={"Accept-Encoding": accept, "If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["ETag"] == etag
+    assert second.data == b""
+
+
+def test_index_etag_differs_per_encoding(client):
+    br = client.get("/", headers={"Accept-Encoding": "br"}).headers["ETag"]
+    plain = client.get("/", headers={"Accept-Encoding": "identity"}).headers["ETag"]
+    assert br != plain
+
+    stale = client.get("/", headers={"Accept-Encoding": "br", "If-None-Match": plain})
+    assert stale.status_code == 200
+
+
+def test_index_revalidation_does_not_recompress(client, monkeypatch):
+    etag = client.get("/", headers={"Accept-Encoding": "br"}).headers["ETag"]
+
+    calls = []
+    compress = brotli.compress
+    monkeypatch.setattr(brotli, "compress", lambda *a, **kw: calls.append(1) or compress(*a, **kw))
+
+    response = client.get("/", headers={"Accept-Encoding": "br", "If-None-Match": etag})
+    assert response.status_code == 304
+    assert calls == []